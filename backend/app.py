@@ -1,28 +1,62 @@
 from __future__ import annotations
 import os
 import yaml
-from typing import Dict, Any, Optional
-from fastapi import FastAPI, HTTPException
+import anyio
+import asyncio
+import functools
+import hashlib
+import json
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Any, AsyncIterator, Callable, Iterator, List, Optional, Tuple
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel, Field
 
+try:
+    from yaml import CSafeLoader as SafeLoader  # libyaml-backed, much faster
+except ImportError:
+    from yaml import SafeLoader
+
 from dotenv import load_dotenv
 load_dotenv()  # loads .env into process env
 
-from factory import build_adapter
+from batching import BatchQueue
+from cache import AdapterCache, TranslationCache
+from factory import build_adapter, routed_adapter_key
 from models import TranslationAdapter
 
 # ---------- Load config ----------
 CONFIG_PATH = os.environ.get("CONFIG_YML", "config.yml")
 with open(CONFIG_PATH, "r") as f:
-    RAW_CFG: Dict[str, Any] = yaml.safe_load(f) or {}
+    RAW_CFG: Dict[str, Any] = yaml.load(f, Loader=SafeLoader) or {}
 
 SERVER_CFG = RAW_CFG.get("server", {})
 DEFAULTS = RAW_CFG.get("defaults", {}) or {}
 HF_CFG = RAW_CFG.get("huggingface", {}) or {}
 MODEL_REGISTRY = RAW_CFG.get("models", {}) or {}
+BATCH_CFG = SERVER_CFG.get("batching", {}) or {}
+# Adapter that actually backs each model (may differ from config.yml with AUTO_CT2), resolved once so
+# responses report the same value whether or not they were served from the translation cache
+MODEL_ADAPTER_KIND: Dict[str, str] = {
+    k: routed_adapter_key((v or {}).get("adapter"), (v or {}).get("params", {})) or "<unknown>"
+    for k, v in MODEL_REGISTRY.items()
+}
 
 # ---------- State (lazy cache of loaded adapters) ----------
-adapter_cache: Dict[str, TranslationAdapter] = {}
+# Bounded: the least recently used model is unloaded when a new one would exceed the limit
+adapter_cache: AdapterCache = AdapterCache(maxsize=int(SERVER_CFG.get("max_loaded_models", 4)))
+# _cache_lock guards adapter_cache; one lock per model key so concurrent first requests load it only once
+_cache_lock = threading.Lock()
+_per_model_locks: Dict[str, threading.Lock] = {}
+# One batch queue per logical model key (created on first request, inside the event loop)
+batch_queues: Dict[str, BatchQueue] = {}
+# Per model key: at most adapter.max_concurrency batches/streams decode at once (shared by both paths).
+# Awaited on the event loop, so requests waiting for a slot don't hold worker threads.
+_model_slots: Dict[str, anyio.Semaphore] = {}
+# Final translations, keyed on (model, text, params)
+translation_cache = TranslationCache(maxsize=SERVER_CFG.get("translation_cache", 10_000))
 
 
 # ---------- Request/Response models ----------
@@ -38,46 +72,209 @@ class TranslateResponse(BaseModel):
     output: str
 
 
-# ---------- FastAPI ----------
-app = FastAPI(title="Unified Translation API", version="0.1.0")
-
-
-def get_or_create_adapter(model_key: str) -> TranslationAdapter:
+def get_or_create_adapter(model_key: str, pin: bool = False) -> TranslationAdapter:
     """
     Returns a cached adapter instance for the given logical model key.
-    Loads and caches on first use.
+    Builds and sets it up on first use (blocking: call it from a worker thread).
+    With pin=True the adapter is pinned in the cache (see pinned_adapter()).
     """
-    if model_key in adapter_cache:
-        return adapter_cache[model_key]
-
     if model_key not in MODEL_REGISTRY:
         raise HTTPException(status_code=404, detail=f"Model '{model_key}' not found in config.yml")
 
-    entry = MODEL_REGISTRY[model_key] or {}
-    adapter_key = entry.get("adapter")
-    params = entry.get("params", {})
+    with _cache_lock:
+        adapter = adapter_cache.get(model_key)  # also refreshes its LRU position
+        if adapter is not None:
+            if pin:
+                adapter_cache.pin(adapter)
+            return adapter
+        model_lock = _per_model_locks.setdefault(model_key, threading.Lock())
 
-    # Merge a small config bundle for the adapter
-    merged_cfg = {
-        "params": params,
-        "defaults": DEFAULTS,
-        "huggingface": HF_CFG,
-    }
+    with model_lock:
+        # Another request may have loaded it while we waited
+        with _cache_lock:
+            adapter = adapter_cache.get(model_key)
+            if adapter is not None and pin:
+                adapter_cache.pin(adapter)
+        if adapter is not None:
+            return adapter
+
+        entry = MODEL_REGISTRY[model_key] or {}
+        adapter_key = entry.get("adapter")
+        params = entry.get("params", {})
+
+        # Merge a small config bundle for the adapter
+        merged_cfg = {
+            "params": params,
+            "defaults": DEFAULTS,
+            "huggingface": HF_CFG,
+        }
 
-    adapter = build_adapter(name=model_key, adapter_key=adapter_key, merged_config=merged_cfg)
-    # Lazy setup: done inside adapter.translate() if not ready
-    adapter_cache[model_key] = adapter
+        adapter = build_adapter(name=model_key, adapter_key=adapter_key, merged_config=merged_cfg)
+        adapter.setup()
+        with _cache_lock:
+            if pin:
+                adapter_cache.pin(adapter)  # before inserting: it may be evicted right away when the cache is tiny
+            adapter_cache[model_key] = adapter  # may evict the least recently used model
+            evicted = adapter_cache.take_evicted()
+
+    # Unload outside the global lock (PyTorch runs gc + empty_cache): other requests keep going
+    for old in evicted:
+        old.unload()
     return adapter
 
 
+@contextmanager
+def pinned_adapter(model_key: str) -> Iterator[TranslationAdapter]:
+    """
+    get_or_create_adapter(), with the adapter kept loaded until the block exits: if the LRU evicts it
+    meanwhile, it is unloaded after its last user is done instead of failing the ones still using it.
+    """
+    adapter = get_or_create_adapter(model_key, pin=True)
+    try:
+        yield adapter
+    finally:
+        with _cache_lock:
+            adapter_cache.unpin(adapter)
+            evicted = adapter_cache.take_evicted()
+        for old in evicted:
+            old.unload()
+
+
+def model_slots(model_key: str, adapter: TranslationAdapter) -> anyio.Semaphore:
+    # Only called on the event loop, which serializes the check-and-create
+    slots = _model_slots.get(model_key)
+    if slots is None:
+        slots = _model_slots[model_key] = anyio.Semaphore(adapter.max_concurrency)
+    return slots
+
+
+def translate_batch(model_key: str, texts: List[str], params: Optional[Dict[str, Any]]) -> List[str]:
+    """
+    Runs one batch for model_key (called from a worker thread by its BatchQueue, holding a decode slot).
+    """
+    with pinned_adapter(model_key) as adapter:
+        return adapter.translate_batch(texts, params=params)
+
+
+def decode_stream(
+    model_key: str,
+    text: str,
+    params: Optional[Dict[str, Any]],
+    emit: Callable[[str, Any], None],
+    stop: threading.Event,
+) -> None:
+    """
+    Decodes one streamed translation (blocking: run it in a worker thread). Calls emit("text", chunk)
+    for each chunk, then emit("done", full final text) or emit("error", exception).
+    Gives up between chunks once `stop` is set.
+    """
+    try:
+        with pinned_adapter(model_key) as adapter:
+            chunks = adapter.translate_stream(text, params=params)
+            try:
+                while not stop.is_set():
+                    try:
+                        chunk = next(chunks)
+                    except StopIteration as end:
+                        emit("done", end.value)
+                        return
+                    emit("text", chunk)
+            finally:
+                chunks.close()
+    except Exception as e:
+        emit("error", e)
+
+
+async def stream_translation(
+    model_key: str, slots: anyio.Semaphore, text: str, params: Optional[Dict[str, Any]]
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Yields ("text", chunk) pairs as they are decoded, then ("done", full final text) or ("error", exception).
+
+    The decode runs in its own task, holding one of the model's slots, and hands chunks over through an
+    unbounded queue: it never waits for the client, so a slow reader doesn't keep the slot (or a worker
+    thread) busy, and the slot is awaited on the event loop rather than in a worker thread.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue[Tuple[str, Any]] = asyncio.Queue()
+    stop = threading.Event()
+
+    def emit(kind: str, value: Any) -> None:
+        loop.call_soon_threadsafe(queue.put_nowait, (kind, value))
+
+    async def decode() -> None:
+        try:
+            async with slots:
+                await anyio.to_thread.run_sync(decode_stream, model_key, text, params, emit, stop)
+        except Exception as e:
+            queue.put_nowait(("error", e))
+
+    decoder = asyncio.create_task(decode())
+    try:
+        while True:
+            kind, value = await queue.get()
+            yield kind, value
+            if kind != "text":
+                return
+    finally:
+        # Client gone (or stream over): stop decoding for nobody, and stop waiting for a slot
+        stop.set()
+        decoder.cancel()
+
+
+def get_batch_queue(model_key: str, adapter: TranslationAdapter) -> BatchQueue:
+    queue = batch_queues.get(model_key)
+    if queue is None:
+        queue = BatchQueue(
+            functools.partial(translate_batch, model_key),
+            max_batch_size=BATCH_CFG.get("max_batch_size", 8),
+            max_wait_ms=BATCH_CFG.get("max_wait_ms", 5),
+            workers=adapter.max_concurrency,
+            slots=model_slots(model_key, adapter),
+        )
+        queue.start()
+        batch_queues[model_key] = queue
+    return queue
+
+
+# ---------- FastAPI ----------
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Blocking inference runs in anyio's worker threads; size the pool from config
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = int(SERVER_CFG.get("threadpool", 100))
+
+    # Eager prewarm of the models listed in defaults.preload (off the event loop)
+    for model_key in DEFAULTS.get("preload") or []:
+        await anyio.to_thread.run_sync(get_or_create_adapter, model_key)
+    yield
+    for queue in batch_queues.values():
+        await queue.close()
+    batch_queues.clear()
+
+
+app = FastAPI(title="Unified Translation API", version="0.1.0", lifespan=lifespan)
+
+
+@app.middleware("http")
+async def backend_time_header(request: Request, call_next):
+    # Server-side time until the response starts, so clients can tell network time from model time
+    started = time.perf_counter()
+    response = await call_next(request)
+    response.headers["X-Backend-Time"] = f"{(time.perf_counter() - started) * 1000.0:.1f}"
+    return response
+
+
 @app.get("/health")
 def health():
-    return {"status": "ok", "loaded_adapters": list(adapter_cache.keys())}
+    with _cache_lock:
+        loaded = list(adapter_cache.keys())
+    return {"status": "ok", "loaded_adapters": loaded}
 
 
-@app.get("/models")
-def list_models():
-    return {
+# The registry is fixed at startup: build the /models body and its ETag once
+MODELS_BODY: bytes = json.dumps(
+    {
         "models": [
             {
                 "name": k,
@@ -88,22 +285,83 @@ def list_models():
         ],
         "default": DEFAULTS.get("adapter", None),
     }
+).encode("utf-8")
+MODELS_ETAG = '"' + hashlib.sha1(MODELS_BODY).hexdigest() + '"'
 
 
-@app.post("/translate", response_model=TranslateResponse)
-def translate(req: TranslateRequest):
+@app.get("/models")
+def list_models(request: Request):
+    # Conditional GET: clients that send back the ETag get an empty 304
+    if_none_match = request.headers.get("if-none-match", "")
+    tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+    if MODELS_ETAG in tags or "*" in tags:
+        return Response(status_code=304, headers={"ETag": MODELS_ETAG})
+    return Response(content=MODELS_BODY, media_type="application/json", headers={"ETag": MODELS_ETAG})
+
+
+def resolve_model_key(req: TranslateRequest) -> str:
     model_key = req.model or DEFAULTS.get("adapter")
     if not model_key:
         raise HTTPException(status_code=400, detail="No model provided and no default adapter configured.")
 
-    adapter = get_or_create_adapter(model_key)
+    if model_key not in MODEL_REGISTRY:
+        raise HTTPException(status_code=404, detail=f"Model '{model_key}' not found in config.yml")
+    return model_key
+
+
+def sse_event(data: Dict[str, Any], event: Optional[str] = None) -> str:
+    payload = json.dumps(data, ensure_ascii=False)
+    return (f"event: {event}\n" if event else "") + f"data: {payload}\n\n"
+
+
+@app.post("/translate", response_model=TranslateResponse)
+async def translate(req: TranslateRequest):
+    model_key = resolve_model_key(req)
+
+    cache_key = translation_cache.key(model_key, req.text, req.params)
+    output = translation_cache.get(cache_key)
+    if output is None:
+        try:
+            # First use loads the model (blocking); keep it off the event loop
+            adapter = await anyio.to_thread.run_sync(get_or_create_adapter, model_key)
+            # Concurrent requests for the same model are grouped into one translate_batch() call,
+            # which runs in a worker thread (inference is blocking PyTorch/CT2)
+            output = await get_batch_queue(model_key, adapter).submit(req.text, req.params)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Translation failed: {e}")
+        translation_cache.put(cache_key, output)
+
+    return TranslateResponse(model=model_key, adapter=MODEL_ADAPTER_KIND[model_key], output=output)
+
+
+@app.post("/translate/stream")
+async def translate_stream(req: TranslateRequest):
+    """
+    Server-Sent Events: `data: {"text": ...}` chunks as they are decoded, then an
+    `event: done` with the same payload as /translate (or `event: error`).
+    Streaming decodes greedily (beam search can't stream), so streams neither read nor fill the
+    translation cache: its entries are /translate's beam-search outputs.
+    Streams share the model's concurrency limit (adapter.max_concurrency) with batched requests.
+    """
+    model_key = resolve_model_key(req)
 
     try:
-        output = adapter.translate(req.text, params=req.params)
+        # Load before the stream starts, so load failures are a regular 500 response
+        adapter = await anyio.to_thread.run_sync(get_or_create_adapter, model_key)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Translation failed: {e}")
+    slots = model_slots(model_key, adapter)
+    adapter_kind = MODEL_ADAPTER_KIND[model_key]
 
-    # Report *which adapter* actually backed the model
-    adapter_kind = MODEL_REGISTRY.get(model_key, {}).get("adapter", "<unknown>")
+    # Async generator: runs on the event loop; the blocking decode runs in a worker thread (stream_translation)
+    async def events():
+        async for kind, value in stream_translation(model_key, slots, req.text, req.params):
+            if kind == "text":
+                yield sse_event({"text": value})
+            elif kind == "done":
+                # Final detokenization, not the concatenated chunks
+                yield sse_event({"model": model_key, "adapter": adapter_kind, "output": value}, event="done")
+            else:
+                yield sse_event({"detail": f"Translation failed: {value}"}, event="error")
 
-    return TranslateResponse(model=model_key, adapter=adapter_kind, output=output)
+    return StreamingResponse(events(), media_type="text/event-stream")
@@ -0,0 +1,119 @@
+# batching.py
+from __future__ import annotations
+import asyncio
+import functools
+import json
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import anyio
+
+# fn(texts, params) -> outputs (same order); runs in a worker thread
+BatchFn = Callable[[List[str], Optional[Dict[str, Any]]], List[str]]
+_Item = Tuple[str, Optional[Dict[str, Any]], "asyncio.Future[str]"]
+
+
+def params_key(params: Optional[Dict[str, Any]]) -> str:
+    return json.dumps(params, sort_keys=True, default=str) if params else ""
+
+
+class BatchQueue:
+    """
+    Collects concurrent requests for one model and runs them as a single batch call.
+
+    A batch is flushed when it holds `max_batch_size` items or `max_wait_ms` after its
+    first item arrived. Requests with different params are run as separate batches.
+    Up to `workers` batches run at the same time (e.g., one per CT2 replica). If `slots` is given, each
+    batch also holds one of its tokens while it runs, so other users of the model can share the limit.
+    """
+
+    def __init__(
+        self,
+        fn: BatchFn,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 5.0,
+        workers: int = 1,
+        slots: Optional[anyio.Semaphore] = None,
+    ) -> None:
+        self.fn = fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.workers = max(1, int(workers))
+        self.slots = slots
+        self._queue: asyncio.Queue[_Item] = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        # Fail whatever is still waiting
+        while not self._queue.empty():
+            _, _, fut = self._queue.get_nowait()
+            if not fut.done():
+                fut.set_exception(RuntimeError("Batch queue closed"))
+
+    async def submit(self, text: str, params: Optional[Dict[str, Any]] = None) -> str:
+        fut: asyncio.Future[str] = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, params, fut))
+        return await fut
+
+    async def _collect(self) -> List[_Item]:
+        items = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while len(items) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            try:
+                if timeout <= 0:
+                    items.append(self._queue.get_nowait())
+                else:
+                    items.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+        return items
+
+    async def _worker(self) -> None:
+        while True:
+            items = await self._collect()
+            try:
+                await self._run(items)
+            finally:
+                # Only reached with pending items if the worker was cancelled mid-batch
+                for _, _, fut in items:
+                    if not fut.done():
+                        fut.set_exception(RuntimeError("Batch queue closed"))
+
+    async def _run(self, items: List[_Item]) -> None:
+        groups: Dict[str, List[_Item]] = {}
+        for item in items:
+            if not item[2].done():  # skip requests whose client went away
+                groups.setdefault(params_key(item[1]), []).append(item)
+
+        for group in groups.values():
+            texts = [text for text, _, _ in group]
+            try:
+                outputs = await self._call(texts, group[0][1])
+            except Exception as e:
+                for _, _, fut in group:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            for (_, _, fut), out in zip(group, outputs):
+                if not fut.done():
+                    fut.set_result(out)
+
+    async def _call(self, texts: List[str], params: Optional[Dict[str, Any]]) -> List[str]:
+        # The slot is awaited on the event loop: a batch waiting for one holds no worker thread
+        if self.slots is None:
+            return await anyio.to_thread.run_sync(functools.partial(self.fn, texts, params))
+        async with self.slots:
+            return await anyio.to_thread.run_sync(functools.partial(self.fn, texts, params))
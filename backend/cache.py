@@ -0,0 +1,81 @@
+# cache.py
+from __future__ import annotations
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from cachetools import LRUCache
+
+from batching import params_key
+
+CacheKey = Tuple[str, str, str]
+
+
+class AdapterCache(LRUCache):
+    """
+    LRU of loaded adapters keyed on model key. Not thread-safe: guard with a lock.
+
+    Evicted adapters are set aside rather than unloaded here, so the (slow) unload can
+    run after the caller releases its lock: call take_evicted() and unload() each one.
+    Adapters in use are pinned (pin()/unpin()): if one is evicted, it is only handed to
+    take_evicted() once its last user unpins it.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        super().__init__(maxsize=maxsize)
+        self._evicted: List[Any] = []
+        # id(adapter) -> number of users; evicted adapters that are still pinned wait in _retired
+        self._pins: Dict[int, int] = {}
+        self._retired: Dict[int, Any] = {}
+
+    def popitem(self):
+        key, adapter = super().popitem()
+        if id(adapter) in self._pins:
+            self._retired[id(adapter)] = adapter
+        else:
+            self._evicted.append(adapter)
+        return key, adapter
+
+    def pin(self, adapter: Any) -> None:
+        self._pins[id(adapter)] = self._pins.get(id(adapter), 0) + 1
+
+    def unpin(self, adapter: Any) -> None:
+        users = self._pins[id(adapter)] - 1
+        if users:
+            self._pins[id(adapter)] = users
+            return
+        del self._pins[id(adapter)]
+        retired = self._retired.pop(id(adapter), None)
+        if retired is not None:
+            self._evicted.append(retired)
+
+    def take_evicted(self) -> List[Any]:
+        evicted, self._evicted = self._evicted, []
+        return evicted
+
+
+class TranslationCache:
+    """
+    Bounded LRU of final translations keyed on (model, normalized text, params).
+    A maxsize of 0 disables caching.
+    """
+
+    def __init__(self, maxsize: int = 10_000) -> None:
+        self.maxsize = max(0, int(maxsize))
+        self._lru: Optional[LRUCache] = LRUCache(maxsize=self.maxsize) if self.maxsize else None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model_key: str, text: str, params: Optional[Dict[str, Any]]) -> CacheKey:
+        return (model_key, text.strip(), params_key(params))
+
+    def get(self, key: CacheKey) -> Optional[str]:
+        if self._lru is None:
+            return None
+        with self._lock:
+            return self._lru.get(key)
+
+    def put(self, key: CacheKey, output: str) -> None:
+        if self._lru is None:
+            return
+        with self._lock:
+            self._lru[key] = output
@@ -1,5 +1,7 @@
 # factory.py
-from typing import Dict, Any, Callable
+import os
+import re
+from typing import Dict, Any, Callable, Tuple
 from models import TranslationAdapter
 
 # Import adapter implementations
@@ -15,7 +17,40 @@ _ADAPTERS: Dict[str, Callable[..., TranslationAdapter]] = {
     "ctranslate2_hf": CTranslate2HFAdapter
 }
 
+# Hub models that run faster on CTranslate2 than on PyTorch (Marian encoder-decoders).
+# NLLB/MBART are left on PyTorch: the CT2 adapters don't pass language target prefixes.
+_CT2_AUTO_ROUTE = re.compile(r"^Helsinki-NLP/opus-mt-")
+
+
+def _auto_route_ct2(adapter_key: str, merged_config: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """
+    With AUTO_CT2=1, serve matching pytorch_hf Hub models through ctranslate2_hf
+    (converted once and cached by CTranslate2HFAdapter).
+    """
+    if adapter_key != "pytorch_hf" or os.getenv("AUTO_CT2") != "1":
+        return adapter_key, merged_config
+
+    params = merged_config.get("params") or {}
+    model_id = params.get("model_id")
+    if not model_id or params.get("model_path") or not _CT2_AUTO_ROUTE.match(model_id):
+        return adapter_key, merged_config
+
+    ct2_params = {k: v for k, v in params.items() if k not in ("model_id", "dtype")}
+    ct2_params.update(
+        transformers_model_id=model_id,
+        auto_convert_if_missing=True,
+        compute_type=params.get("compute_type") or "int8",
+    )
+    return "ctranslate2_hf", {**merged_config, "params": ct2_params}
+
+
+def routed_adapter_key(adapter_key: str, params: Dict[str, Any]) -> str:
+    """Adapter key build_adapter() will actually use for this config entry (without building it)."""
+    return _auto_route_ct2(adapter_key, {"params": params or {}})[0]
+
+
 def build_adapter(name: str, adapter_key: str, merged_config: Dict[str, Any]) -> TranslationAdapter:
+    adapter_key, merged_config = _auto_route_ct2(adapter_key, merged_config)
     try:
         cls = _ADAPTERS[adapter_key]
     except KeyError:
@@ -1,23 +1,69 @@
 # models/__init__.py
 from __future__ import annotations
 from abc import ABC, abstractmethod
-from typing import Any, Dict, Optional
+from types import MappingProxyType
+from typing import Any, Dict, Generator, List, Mapping, Optional
+
+class AdapterUnloadedError(RuntimeError):
+    """The adapter was evicted from the adapter cache; get a fresh one through the cache."""
+
 
 class TranslationAdapter(ABC):
     def __init__(self, name: str, config: Dict[str, Any]) -> None:
         self.name = name
         self.config = config or {}
         self._is_ready = False
+        self._unloaded = False
+        # How many batches may run on this adapter at the same time
+        self.max_concurrency = 1
+        # defaults.generation overlaid with the model's params.generation, computed once
+        gen_defaults = (self.config.get("defaults") or {}).get("generation") or {}
+        gen_model = (self.config.get("params") or {}).get("generation") or {}
+        self._frozen_gen_defaults: Mapping[str, Any] = MappingProxyType({**gen_defaults, **gen_model})
 
     @abstractmethod
     def setup(self) -> None: ...
     @abstractmethod
     def translate(self, text: str, *, params: Optional[Dict[str, Any]] = None) -> str: ...
 
+    def translate_batch(self, texts: List[str], *, params: Optional[Dict[str, Any]] = None) -> List[str]:
+        """Translate several texts sharing the same params. Adapters override this to batch on device."""
+        return [self.translate(t, params=params) for t in texts]
+
+    def translate_stream(self, text: str, *, params: Optional[Dict[str, Any]] = None) -> Generator[str, None, str]:
+        """
+        Yield the translation in chunks as it is decoded and return the full final text
+        (chunks may not add up to it exactly). Default: a single chunk.
+        """
+        output = self.translate(text, params=params)
+        yield output
+        return output
+
+    def unload(self) -> None:
+        """
+        Release the loaded model (called when evicted from the adapter cache). Adapters drop their refs here.
+        An unloaded adapter never loads itself again: later calls raise AdapterUnloadedError.
+        """
+        self._unloaded = True
+        self._is_ready = False
+
+    def _ensure_loaded(self) -> None:
+        # Lazy setup on first use only; reloading an evicted adapter would bypass the cache's limit
+        if self._unloaded:
+            raise AdapterUnloadedError(f"[{self.name}] adapter was unloaded")
+        if not self._is_ready:
+            self.setup()
+
+    def _gen_params(self, overrides: Optional[Dict[str, Any]]) -> Mapping[str, Any]:
+        # No copy on the common path (no per-request params)
+        if not overrides:
+            return self._frozen_gen_defaults
+        return merged_params(self._frozen_gen_defaults, overrides)
+
     def is_ready(self) -> bool: return self._is_ready
     def _mark_ready(self) -> None: self._is_ready = True
 
-def merged_params(defaults: Dict[str, Any], overrides: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+def merged_params(defaults: Mapping[str, Any], overrides: Optional[Dict[str, Any]]) -> Dict[str, Any]:
     merged = dict(defaults or {})
     if overrides: merged.update({k: v for k, v in overrides.items() if v is not None})
     return merged
@@ -0,0 +1,195 @@
+# models/ctranslate2_base.py
+from __future__ import annotations
+from typing import Any, Dict, FrozenSet, Generator, Mapping, Optional, List, Tuple
+import threading
+import ctranslate2
+from cachetools import LRUCache
+from transformers import AutoTokenizer
+from . import AdapterUnloadedError, TranslationAdapter
+
+
+class CTranslate2BaseAdapter(TranslationAdapter):
+    """
+    Shared translate path for the CTranslate2 adapters.
+
+    Subclasses implement setup() and must set `self.translator` and `self.tokenizer`.
+
+    Common params:
+      - token_cache_size: int (default 4096; LRU of text -> source tokens, 0 disables)
+      - num_threads: int (optional; sets both inter_threads and intra_threads)
+      - replicas: int (optional; CT2 inter_threads = model replicas that run batches in parallel)
+      - intra_threads: int (optional; threads per replica on CPU)
+      - device_index: int | list[int] (optional; GPU(s) to place replicas on)
+      - max_queued_batches: int (optional; CT2 internal queue size, 0 = auto)
+      - strip_tokens: list[str] (optional; extra leading output tokens to drop, e.g. language codes)
+    """
+
+    def __init__(self, name: str, config: Dict[str, Any]) -> None:
+        super().__init__(name, config)
+        self.translator: Optional[ctranslate2.Translator] = None
+        self.tokenizer: Optional[AutoTokenizer] = None
+        self.device: str = "cpu"
+        # Leading target tokens dropped from hypotheses (language codes etc.), built in setup()
+        self._strip_set: FrozenSet[str] = frozenset()
+
+        cache_size = int(((self.config or {}).get("params") or {}).get("token_cache_size", 4096))
+        self._token_cache: Optional[LRUCache] = LRUCache(maxsize=cache_size) if cache_size > 0 else None
+        self._token_cache_lock = threading.Lock()
+
+        # translate_batch kwargs for requests without params, built once
+        self._default_ct2_kwargs: Dict[str, Any] = self._ct2_kwargs(self._frozen_gen_defaults)
+
+        # Each replica can run one batch at a time; let the batch queue keep them all busy
+        replicas = self._positive_int(((self.config or {}).get("params") or {}).get("replicas"))
+        if replicas:
+            self.max_concurrency = replicas
+
+    @staticmethod
+    def _ct2_kwargs(gen: Mapping[str, Any]) -> Dict[str, Any]:
+        # CT2 generation settings
+        # For deterministic translation we use beam search (sampling off).
+        beam_size = max(1, int(gen.get("num_beams", 4)))
+        sample = bool(gen.get("do_sample", False))
+        return {
+            "beam_size": 1 if sample else beam_size,
+            "sampling_topk": 1 if not sample else 50,  # default top-k if sampling
+            "sampling_temperature": 1.0 if not sample else float(gen.get("temperature", 1.0)),
+            "max_decoding_length": int(gen.get("max_new_tokens", 128)),
+        }
+
+    def _ct2_kwargs_for(self, params: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        if not params:
+            return self._default_ct2_kwargs
+        return self._ct2_kwargs(self._gen_params(params))
+
+    @staticmethod
+    def _positive_int(value: Any) -> Optional[int]:
+        return value if isinstance(value, int) and value > 0 else None
+
+    def _translator_kwargs(self, params: Dict[str, Any], compute_type: str) -> Dict[str, Any]:
+        kwargs: Dict[str, Any] = {"device": self.device, "compute_type": compute_type}
+        num_threads = self._positive_int(params.get("num_threads"))
+        if num_threads:
+            kwargs["inter_threads"] = num_threads
+            kwargs["intra_threads"] = num_threads
+        if self.max_concurrency > 1:
+            kwargs["inter_threads"] = self.max_concurrency
+        intra_threads = self._positive_int(params.get("intra_threads"))
+        if intra_threads:
+            kwargs["intra_threads"] = intra_threads
+        if params.get("device_index") is not None:
+            kwargs["device_index"] = params["device_index"]
+        if params.get("max_queued_batches") is not None:
+            kwargs["max_queued_batches"] = int(params["max_queued_batches"])
+        return kwargs
+
+    def _build_strip_set(self) -> None:
+        # Subclasses call this at the end of setup(), once the tokenizer is loaded
+        params = (self.config or {}).get("params") or {}
+        tokens = set(getattr(self.tokenizer, "additional_special_tokens", None) or [])
+        tokens.update(params.get("strip_tokens") or [])
+        if params.get("tgt_lang"):
+            tokens.add(params["tgt_lang"])
+        self._strip_set = frozenset(tokens)
+
+    def unload(self) -> None:
+        # In-flight batches keep their own references until they finish
+        self.translator = None
+        self.tokenizer = None
+        if self._token_cache is not None:
+            with self._token_cache_lock:
+                self._token_cache.clear()
+        super().unload()
+
+    def _tokenize_batch(self, tokenizer: AutoTokenizer, texts: List[str]) -> List[Tuple[str, ...]]:
+        """
+        Source token *strings* for CT2, one tuple per text (the CT2 Translator only accepts
+        string tokens). Cache misses are encoded with a single tokenizer call (the fast
+        tokenizer parallelizes the batch).
+        """
+        cache = self._token_cache
+        found: Dict[str, Tuple[str, ...]] = {}
+        if cache is not None:
+            with self._token_cache_lock:
+                for text in texts:
+                    tokens = cache.get(text)
+                    if tokens is not None:
+                        found[text] = tokens
+
+        misses = [t for t in dict.fromkeys(texts) if t not in found]
+        if misses:
+            enc = tokenizer(misses, add_special_tokens=True)
+            encodings = getattr(enc, "encodings", None)
+            if encodings:
+                # Fast (Rust) tokenizers already return the token strings; no id -> token pass
+                for text, e in zip(misses, encodings):
+                    found[text] = tuple(e.tokens)
+            else:
+                for text, ids in zip(misses, enc["input_ids"]):
+                    found[text] = tuple(tokenizer.convert_ids_to_tokens(ids))
+            if cache is not None:
+                with self._token_cache_lock:
+                    for text in misses:
+                        cache[text] = found[text]
+
+        return [found[t] for t in texts]
+
+    def _strip_set_for(self, params: Optional[Dict[str, Any]]) -> FrozenSet[str]:
+        # Language hints (used for MBART/NLLB; Marian ignores): a per-request tgt_lang is stripped too
+        req_tgt_lang = (params or {}).get("tgt_lang")
+        if req_tgt_lang and req_tgt_lang not in self._strip_set:
+            return self._strip_set | {req_tgt_lang}
+        return self._strip_set
+
+    def translate(self, text: str, *, params: Optional[Dict[str, Any]] = None) -> str:
+        return self.translate_batch([text], params=params)[0]
+
+    def translate_batch(self, texts: List[str], *, params: Optional[Dict[str, Any]] = None) -> List[str]:
+        self._ensure_loaded()
+        # Local refs: unload() may run concurrently when the adapter is evicted
+        translator, tokenizer = self.translator, self.tokenizer
+        if translator is None or tokenizer is None:
+            raise AdapterUnloadedError(f"[{self.name}] adapter was unloaded")
+
+        strip_set = self._strip_set_for(params)
+        batch_tokens: List[List[str]] = [list(tokens) for tokens in self._tokenize_batch(tokenizer, texts)]
+        results = translator.translate_batch(batch_tokens, **self._ct2_kwargs_for(params))
+
+        outputs: List[str] = []
+        for res in results:
+            tgt_tokens: List[str] = res.hypotheses[0]
+            # Drop leading language/special tokens some multilingual models emit (none for Marian)
+            start = 0
+            while start < len(tgt_tokens) and tgt_tokens[start] in strip_set:
+                start += 1
+            if start:
+                tgt_tokens = tgt_tokens[start:]
+            outputs.append(tokenizer.convert_tokens_to_string(tgt_tokens).strip())
+        return outputs
+
+    def translate_stream(self, text: str, *, params: Optional[Dict[str, Any]] = None) -> Generator[str, None, str]:
+        self._ensure_loaded()
+        translator, tokenizer = self.translator, self.tokenizer
+        if translator is None or tokenizer is None:
+            raise AdapterUnloadedError(f"[{self.name}] adapter was unloaded")
+
+        strip_set = self._strip_set_for(params)
+        src_tokens = list(self._tokenize_batch(tokenizer, [text])[0])
+
+        # Token streaming is not compatible with beam search: greedy (or sampling if requested)
+        step_kwargs = {k: v for k, v in self._ct2_kwargs_for(params).items() if k != "beam_size"}
+        steps = translator.generate_tokens(src_tokens, **step_kwargs)
+
+        tgt_tokens: List[str] = []
+        emitted = ""
+        for step in steps:
+            if not tgt_tokens and step.token in strip_set:
+                continue
+            tgt_tokens.append(step.token)
+            # Detokenize the whole prefix: subword pieces only become text once joined
+            decoded = tokenizer.convert_tokens_to_string(tgt_tokens).strip()
+            if len(decoded) > len(emitted) and decoded.startswith(emitted):
+                yield decoded[len(emitted):]
+                emitted = decoded
+        # Steps whose text didn't extend the emitted prefix were never yielded: the final text is the full decode
+        return tokenizer.convert_tokens_to_string(tgt_tokens).strip()
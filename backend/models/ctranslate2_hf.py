@@ -1,20 +1,31 @@
 # models/ctranslate2_hf.py
 from __future__ import annotations
-from typing import Any, Dict, Optional, List
+from typing import Any, Dict, Optional, Tuple
 import os
-import subprocess
 import shutil
+import threading
+from concurrent.futures import Future
 from pathlib import Path
 
 import ctranslate2
+from ctranslate2.converters import TransformersConverter
 from transformers import AutoTokenizer
 from huggingface_hub import snapshot_download
 from huggingface_hub.utils import HfHubHTTPError
 
-from . import TranslationAdapter, merged_params
+from .ctranslate2_base import CTranslate2BaseAdapter
 
+# In-flight snapshot downloads, keyed by everything that affects the result: adapters loading the
+# same repo at the same time share one snapshot_download call. Entries are dropped once it finishes,
+# so a later load (e.g., after eviction) resolves the revision against the Hub/cache again.
+_snap_inflight: Dict[Tuple[str, Optional[str], Optional[str], bool, Optional[str], bool], Future] = {}
+_snap_lock = threading.Lock()
 
-class CTranslate2HFAdapter(TranslationAdapter):
+# Written (atomically) into an auto-converted CT2 dir once conversion has fully succeeded
+_CT2_OK_MARKER = ".ct2_ok"
+
+
+class CTranslate2HFAdapter(CTranslate2BaseAdapter):
     """
     Load a pre-converted CTranslate2 model from Hugging Face,
     OR auto-convert a Transformers model on first use.
@@ -35,15 +46,13 @@ class CTranslate2HFAdapter(TranslationAdapter):
       - device: "auto"|"cpu"|"cuda" (default "auto")
       - compute_type: str (e.g., "int8_float16" default, "int8", "int16", "float16", "float32")
       - num_threads: int (optional)
+      - replicas / intra_threads / device_index / max_queued_batches: optional (see CTranslate2BaseAdapter)
       - ct2_cache_subdir: str (optional; where to store auto-converted CT2 dir)
       - src_lang / tgt_lang: optional (for multilingual models)
     """
 
     def __init__(self, name: str, config: Dict[str, Any]) -> None:
         super().__init__(name, config)
-        self.translator: Optional[ctranslate2.Translator] = None
-        self.tokenizer: Optional[AutoTokenizer] = None
-        self.device = "cpu"
         self.model_dir: Optional[str] = None
 
     def _pick_device(self, dev: str) -> str:
@@ -59,6 +68,30 @@ class CTranslate2HFAdapter(TranslationAdapter):
 
     def _download_snapshot(self, repo_id: str, revision: Optional[str], cache_dir: Optional[str],
                            local_only: bool, token: Optional[str], strict_auth: bool) -> str:
+        key = (repo_id, revision, cache_dir, local_only, token, strict_auth)
+        with _snap_lock:
+            fut = _snap_inflight.get(key)
+            owner = fut is None
+            if owner:
+                fut = Future()
+                _snap_inflight[key] = fut
+        if not owner:
+            return fut.result()
+
+        try:
+            path = self._fetch_snapshot(repo_id, revision, cache_dir, local_only, token, strict_auth)
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        else:
+            fut.set_result(path)
+        finally:
+            with _snap_lock:
+                _snap_inflight.pop(key, None)
+        return path
+
+    def _fetch_snapshot(self, repo_id: str, revision: Optional[str], cache_dir: Optional[str],
+                        local_only: bool, token: Optional[str], strict_auth: bool) -> str:
         def _snap(use_auth: bool) -> str:
             kw = dict(repo_id=repo_id, revision=revision, cache_dir=cache_dir, local_files_only=local_only)
             if use_auth and token:
@@ -94,35 +127,27 @@ class CTranslate2HFAdapter(TranslationAdapter):
         out_dir = base_cache / (out_subdir or (t_repo.replace("/", "__") + f"__{compute_type}"))
         out_dir.mkdir(parents=True, exist_ok=True)
 
-        # If directory already contains a CT2 model (model.bin present), reuse it
-        if (out_dir / "model.bin").exists():
+        # Reuse a previous conversion only if it completed (model.bin alone may be a partial write)
+        if (out_dir / _CT2_OK_MARKER).exists():
             return str(out_dir)
 
         # 2) Download the original Transformers model
         snap_dir = self._download_snapshot(t_repo, revision, cache_dir, local_only, token, strict_auth)
 
-        # 3) Convert with the ct2 CLI
-        cmd = [
-            "ct2-transformers-converter",
-            "--model", snap_dir,
-            "--output_dir", str(out_dir),
-            "--quantization", compute_type,
-            "--force"
-        ]
+        # 3) Convert in-process (no extra interpreter re-importing torch/transformers)
         try:
-            subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        except FileNotFoundError:
-            raise RuntimeError(
-                f"[{self.name}] ct2-transformers-converter not found. Is ctranslate2 installed?"
-            )
-        except subprocess.CalledProcessError as e:
+            TransformersConverter(snap_dir).convert(str(out_dir), quantization=compute_type, force=True)
+        except Exception as e:
             # Clean up partial conversion
             try:
                 shutil.rmtree(out_dir)
             except Exception:
                 pass
-            raise RuntimeError(f"[{self.name}] CT2 conversion failed: {e.stderr.decode('utf-8', 'ignore')}")
+            raise RuntimeError(f"[{self.name}] CT2 conversion failed: {e}") from e
 
+        tmp_marker = out_dir / (_CT2_OK_MARKER + ".tmp")
+        tmp_marker.write_text(compute_type)
+        os.replace(tmp_marker, out_dir / _CT2_OK_MARKER)
         return str(out_dir)
 
     def setup(self) -> None:
@@ -162,55 +187,18 @@ class CTranslate2HFAdapter(TranslationAdapter):
             raise RuntimeError(f"[{self.name}] CT2 model directory not found: {self.model_dir}")
 
         # Init CTranslate2 Translator
-        tkwargs: Dict[str, Any] = {"device": self.device, "compute_type": compute_type}
-        num_threads = params.get("num_threads")
-        if isinstance(num_threads, int) and num_threads > 0:
-            tkwargs["inter_threads"] = num_threads
-            tkwargs["intra_threads"] = num_threads
-        self.translator = ctranslate2.Translator(self.model_dir, **tkwargs)
+        self.translator = ctranslate2.Translator(self.model_dir, **self._translator_kwargs(params, compute_type))
 
         # Load tokenizer
         tok_id = params.get("tokenizer_id") or t_repo or model_id
         self.tokenizer = AutoTokenizer.from_pretrained(
             tok_id,
+            use_fast=True,
             cache_dir=cache_dir,
             local_files_only=local_only,
             token=(token if token else None),
             revision=revision,
         )
 
+        self._build_strip_set()
         self._mark_ready()
-
-    def translate(self, text: str, *, params: Optional[Dict[str, Any]] = None) -> str:
-        if not self.is_ready():
-            self.setup()
-
-        cfg = (self.config.get("params") or {})
-        gen_defaults = (self.config.get("defaults") or {}).get("generation", {})
-        gen = merged_params(gen_defaults, params)
-
-        src_lang = (params or {}).get("src_lang") or cfg.get("src_lang")
-        tgt_lang = (params or {}).get("tgt_lang") or cfg.get("tgt_lang")
-
-        enc = self.tokenizer(text, add_special_tokens=True)
-        ids: List[int] = enc["input_ids"]
-        src_tokens: List[str] = self.tokenizer.convert_ids_to_tokens(ids)
-
-        beam_size = max(1, int(gen.get("num_beams", 4)))
-        max_out = int(gen.get("max_new_tokens", 128))
-        sample = bool(gen.get("do_sample", False))
-
-        results = self.translator.translate_batch(
-            [src_tokens],
-            beam_size=1 if sample else beam_size,
-            sampling_topk=1 if not sample else 50,
-            sampling_temperature=1.0 if not sample else float(gen.get("temperature", 1.0)),
-            max_decoding_length=max_out,
-        )
-
-        tgt_tokens: List[str] = results[0].hypotheses[0]
-        if tgt_lang and tgt_tokens and tgt_tokens[0] == tgt_lang:
-            tgt_tokens = tgt_tokens[1:]
-
-        out_text = self.tokenizer.convert_tokens_to_string(tgt_tokens).strip()
-        return out_text
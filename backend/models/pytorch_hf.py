@@ -1,11 +1,13 @@
 # models/pytorch_hf.py
 from __future__ import annotations
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Generator, List, Optional, Tuple
+import gc
 import os
+import threading
 import torch
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+from transformers import AutoTokenizer, AutoModelForSeq2SeqLM, TextIteratorStreamer
 from huggingface_hub.utils import HfHubHTTPError
-from . import TranslationAdapter, merged_params
+from . import AdapterUnloadedError, TranslationAdapter
 
 class PytorchHFAdapter(TranslationAdapter):
     def __init__(self, name: str, config: Dict[str, Any]) -> None:
@@ -39,8 +41,17 @@ class PytorchHFAdapter(TranslationAdapter):
             raise ValueError(f"[{self.name}] Invalid device '{dev_cfg}'.")
 
         dtype_cfg = (params.get("dtype") or "auto").lower()
+        # int8: bitsandbytes 8-bit weights on CUDA, dynamic quantization of nn.Linear on CPU
+        quantize_int8 = dtype_cfg == "int8"
+        model_kw: Dict[str, Any] = {}
         if dtype_cfg == "auto":
             torch_dtype = torch.float16 if self.device == "cuda" else torch.float32
+        elif quantize_int8:
+            torch_dtype = torch.float16 if self.device == "cuda" else torch.float32
+            if self.device == "cuda":
+                from transformers import BitsAndBytesConfig  # requires the bitsandbytes package
+                model_kw["quantization_config"] = BitsAndBytesConfig(load_in_8bit=True)
+                model_kw["device_map"] = "auto"
         else:
             m = {"float32": torch.float32, "float16": torch.float16, "bfloat16": torch.bfloat16}
             torch_dtype = m.get(dtype_cfg)
@@ -67,14 +78,16 @@ class PytorchHFAdapter(TranslationAdapter):
         def _load_any(auth: bool):
             if model_path:
                 # Local directory only; ignore token
-                tok = AutoTokenizer.from_pretrained(model_path, local_files_only=True)
-                mdl = AutoModelForSeq2SeqLM.from_pretrained(model_path, torch_dtype=torch_dtype, local_files_only=True)
+                tok = AutoTokenizer.from_pretrained(model_path, use_fast=True, local_files_only=True)
+                mdl = AutoModelForSeq2SeqLM.from_pretrained(
+                    model_path, torch_dtype=torch_dtype, local_files_only=True, **model_kw
+                )
                 return tok, mdl
             else:
                 # From Hub (may use auth)
                 kw = _load_kwargs(base_auth=auth)
-                tok = AutoTokenizer.from_pretrained(model_id, **kw)
-                mdl = AutoModelForSeq2SeqLM.from_pretrained(model_id, torch_dtype=torch_dtype, **kw)
+                tok = AutoTokenizer.from_pretrained(model_id, use_fast=True, **kw)
+                mdl = AutoModelForSeq2SeqLM.from_pretrained(model_id, torch_dtype=torch_dtype, **kw, **model_kw)
                 return tok, mdl
 
         # Main load
@@ -107,15 +120,41 @@ class PytorchHFAdapter(TranslationAdapter):
         except Exception as e:
             raise RuntimeError(f"[{self.name}] Failed to load model: {e}") from e
 
-        self.model = self.model.to(self.device)
+        if quantize_int8 and self.device == "cpu":
+            self.model = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        elif not quantize_int8:
+            # 8-bit CUDA models are already placed by device_map and can't be moved
+            self.model = self.model.to(self.device)
+        self.model.eval()
+
+        # Opt-in kernel fusion. generate() calls forward() internally, so compile the bound
+        # forward rather than wrapping the module. The default mode avoids CUDA graphs: input
+        # shapes and the dynamic KV cache change on every request/step and would keep re-recording.
+        if params.get("compile") and not quantize_int8:
+            compile_mode = params.get("compile_mode") or "default"
+            self.model.forward = torch.compile(self.model.forward, mode=compile_mode, fullgraph=False)
+
         self._mark_ready()
 
+    def unload(self) -> None:
+        # In-flight batches keep their own references until they finish
+        self.model = None
+        self.tokenizer = None
+        gc.collect()  # a compiled forward keeps a reference cycle to the model
+        if self.device == "cuda":
+            torch.cuda.empty_cache()
+        super().unload()
+
     def translate(self, text: str, *, params: Optional[Dict[str, Any]] = None) -> str:
-        if not self.is_ready():
-            self.setup()
+        out = self.translate_batch([text], params=params)
+        return out[0] if out else ""
 
-        gen_defaults = (self.config.get("defaults") or {}).get("generation", {})
-        gen_params = merged_params(gen_defaults, params)
+    def _prepare(self, tokenizer, texts: List[str], params: Optional[Dict[str, Any]]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        Tokenizes texts onto the model device and builds the generate() kwargs.
+        Returns (inputs, generate_kwargs).
+        """
+        gen_params = self._gen_params(params)
 
         # Optional: language hints for MBART/NLLB
         forced_bos_token_id = None
@@ -123,27 +162,73 @@ class PytorchHFAdapter(TranslationAdapter):
         tgt_lang = (params or {}).get("tgt_lang") or cfg_params.get("tgt_lang")
         src_lang = (params or {}).get("src_lang") or cfg_params.get("src_lang")
 
-        if src_lang and hasattr(self.tokenizer, "src_lang"):
-            try: self.tokenizer.src_lang = src_lang
+        if src_lang and hasattr(tokenizer, "src_lang"):
+            try: tokenizer.src_lang = src_lang
             except Exception: pass
-        if tgt_lang and hasattr(self.tokenizer, "tgt_lang"):
-            try: self.tokenizer.tgt_lang = tgt_lang
+        if tgt_lang and hasattr(tokenizer, "tgt_lang"):
+            try: tokenizer.tgt_lang = tgt_lang
             except Exception: pass
-        if tgt_lang and hasattr(self.tokenizer, "lang_code_to_id"):
-            forced_bos_token_id = getattr(self.tokenizer, "lang_code_to_id", {}).get(tgt_lang)
-
-        inputs = self.tokenizer([text], return_tensors="pt", padding=True).to(self.device)
-
-        with torch.no_grad():
-            generate_kwargs = dict(
-                max_new_tokens=int(gen_params.get("max_new_tokens", 256)),
-                num_beams=int(gen_params.get("num_beams", 4)),
-                do_sample=bool(gen_params.get("do_sample", False)),
-            )
-            if forced_bos_token_id is not None:
-                generate_kwargs["forced_bos_token_id"] = forced_bos_token_id
+        if tgt_lang and hasattr(tokenizer, "lang_code_to_id"):
+            forced_bos_token_id = getattr(tokenizer, "lang_code_to_id", {}).get(tgt_lang)
 
-            output_ids = self.model.generate(**inputs, **generate_kwargs)
-
-        out = self.tokenizer.batch_decode(output_ids, skip_special_tokens=True)
-        return out[0] if out else ""
+        inputs = tokenizer(list(texts), return_tensors="pt", padding=True)
+        if self.device == "cuda":
+            # Pinned host memory (reused by torch's caching host allocator) lets the H2D copy run async
+            inputs = {k: v.pin_memory().to(self.device, non_blocking=True) for k, v in inputs.items()}
+        else:
+            inputs = dict(inputs)
+
+        generate_kwargs = dict(
+            max_new_tokens=int(gen_params.get("max_new_tokens", 256)),
+            num_beams=int(gen_params.get("num_beams", 4)),
+            do_sample=bool(gen_params.get("do_sample", False)),
+        )
+        if forced_bos_token_id is not None:
+            generate_kwargs["forced_bos_token_id"] = forced_bos_token_id
+        return inputs, generate_kwargs
+
+    def translate_batch(self, texts: List[str], *, params: Optional[Dict[str, Any]] = None) -> List[str]:
+        self._ensure_loaded()
+        # Local refs: unload() may run concurrently when the adapter is evicted
+        model, tokenizer = self.model, self.tokenizer
+        if model is None or tokenizer is None:
+            raise AdapterUnloadedError(f"[{self.name}] adapter was unloaded")
+
+        inputs, generate_kwargs = self._prepare(tokenizer, texts, params)
+        with torch.inference_mode():
+            output_ids = model.generate(**inputs, **generate_kwargs)
+
+        return tokenizer.batch_decode(output_ids, skip_special_tokens=True)
+
+    def translate_stream(self, text: str, *, params: Optional[Dict[str, Any]] = None) -> Generator[str, None, str]:
+        self._ensure_loaded()
+        model, tokenizer = self.model, self.tokenizer
+        if model is None or tokenizer is None:
+            raise AdapterUnloadedError(f"[{self.name}] adapter was unloaded")
+
+        inputs, generate_kwargs = self._prepare(tokenizer, [text], params)
+        # Streamers don't support beam search: decode greedily (or sample if requested)
+        generate_kwargs["num_beams"] = 1
+        streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+        errors: List[BaseException] = []
+
+        def _generate() -> None:
+            try:
+                with torch.inference_mode():
+                    model.generate(**inputs, **generate_kwargs, streamer=streamer)
+            except BaseException as e:
+                errors.append(e)
+                streamer.end()  # unblock the consumer
+
+        worker = threading.Thread(target=_generate, daemon=True)
+        worker.start()
+        parts: List[str] = []
+        for chunk in streamer:
+            if chunk:
+                parts.append(chunk)
+                yield chunk
+        worker.join()
+        if errors:
+            raise errors[0]
+        # TextIteratorStreamer flushes every decoded character by the end, so the chunks add up to the output
+        return "".join(parts).strip()
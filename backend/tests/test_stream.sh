@@ -0,0 +1,3 @@
+curl -N -s -X POST http://localhost:8080/translate/stream \
+  -H 'Content-Type: application/json' \
+  -d '{ "model":"es-en-tiny", "text":"Necesito una traducción confiable.", "params":{"max_new_tokens":64} }'
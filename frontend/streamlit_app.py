@@ -1,67 +1,242 @@
 import json
+import re
 import time
-from typing import Dict, List, Any
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterator, List, Any, Optional, Tuple
 from pathlib import Path
+from string import Template
 
+import orjson
 import requests
 import streamlit as st
+import urllib3
+from requests.adapters import HTTPAdapter
 from streamlit.components.v1 import html
+from urllib3.util.retry import Retry
+
+
+_ES_EN_RE = re.compile(r"es-en", re.I)
+_JSON_HEADERS = {"Content-Type": "application/json"}
+# One retry policy for both HTTP clients. The last 5xx is returned rather than raised, so its detail can be shown.
+_RETRY = Retry(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504], raise_on_status=False)
 
 
 # ----------------- Helpers -----------------
+@st.cache_resource
+def _http() -> requests.Session:
+    """
+    Process-wide session: keeps connections to the backend alive across Streamlit reruns.
+    Pools are per host, so one session serves any API base URL.
+    """
+    s = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=_RETRY,
+    )
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    return s
+
+
 def filter_es_to_en(model_items: List[Dict[str, Any]]) -> List[str]:
-    out: List[str] = []
+    # dict as an insertion-ordered set: dedupes in the same pass
+    names: Dict[str, None] = {}
     for m in model_items:
-        name = (m.get("name") or "").lower()
-        if "es-en" in name:
-            out.append(m["name"])
+        name = m.get("name") or ""
+        if _ES_EN_RE.search(name):
+            names[name] = None
             continue
-        p = m.get("params", {}) or {}
-        src = (p.get("src_lang") or "").lower()
-        tgt = (p.get("tgt_lang") or "").lower()
-        if src.startswith("spa") and tgt.startswith("eng"):
-            out.append(m["name"])
-    return sorted(set(out))
+        p = m.get("params") or {}
+        src = (p.get("src_lang") or "").casefold()
+        tgt = (p.get("tgt_lang") or "").casefold()
+        if src[:3] == "spa" and tgt[:3] == "eng":
+            names[name] = None
+    uniq = list(names)
+    uniq.sort(key=str.casefold)
+    return uniq
 
 
-def copy_to_clipboard_js(text: str):
-    safe = json.dumps(text)
-    html(
-        f"""
+@st.cache_resource
+def _models_by_etag() -> Dict[str, Tuple[str, Tuple[Dict[str, Any], List[str]]]]:
+    # api_base -> (ETag, fetch_models result); process-wide so it outlives fetch_models' TTL
+    return {}
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def fetch_models(api_base: str) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    GET /models, memoized for 60 s per API base URL.
+    Returns (payload, es→en model names). Errors are raised (and not cached).
+    Revalidates with If-None-Match, so an unchanged model list comes back as an empty 304.
+    """
+    known = _models_by_etag().get(api_base)
+    headers = {"If-None-Match": known[0]} if known else None
+    r = _http().get(f"{api_base}/models", headers=headers, timeout=5)
+    if r.status_code == 304 and known:
+        return known[1]
+    r.raise_for_status()
+    payload = orjson.loads(r.content)
+    result = (payload, filter_es_to_en(payload.get("models", [])))
+    etag = r.headers.get("ETag")
+    if etag:
+        _models_by_etag()[api_base] = (etag, result)
+    return result
+
+
+@st.cache_resource
+def _pool() -> urllib3.PoolManager:
+    """
+    Bare urllib3 pool for the plain /translate POSTs of the translate-all fan-out: skips the per-call
+    requests layer (PreparedRequest, cookies, hooks) that none of these calls use. Same sizes and
+    retry policy as _http().
+    """
+    return urllib3.PoolManager(num_pools=4, maxsize=16, retries=_RETRY)
+
+
+class BackendHTTPError(Exception):
+    """Error status from the backend on a urllib3 call (requests calls raise requests.HTTPError)."""
+
+    def __init__(self, status: int, body: bytes, reason: str) -> None:
+        super().__init__(f"HTTP {status}: {reason}")
+        self.status = status
+        self.body = body
+
+
+def translate_text(api_base: str, model: str, text: str, timeout: float = 60) -> str:
+    """POST /translate over the shared pool; raises on HTTP errors. Safe to call from worker threads."""
+    resp = _pool().request(
+        "POST",
+        f"{api_base}/translate",
+        body=orjson.dumps({"model": model, "text": text}),
+        headers=_JSON_HEADERS,
+        timeout=timeout,
+    )
+    if resp.status >= 400:
+        raise BackendHTTPError(resp.status, resp.data, resp.reason or "")
+    return orjson.loads(resp.data).get("output", "")
+
+
+def _http_error_message(status: int, body: bytes, fallback: str) -> str:
+    try:
+        detail = orjson.loads(body).get("detail")
+    except Exception:
+        detail = fallback
+    return f"HTTP {status}: {detail}"
+
+
+def error_message(e: Exception) -> str:
+    """One message format for failed backend calls: "HTTP <status>: <detail>" or "Request failed: ..."."""
+    if isinstance(e, BackendHTTPError):
+        return _http_error_message(e.status, e.body, str(e))
+    resp = getattr(e, "response", None)
+    if isinstance(e, requests.HTTPError) and resp is not None:
+        return _http_error_message(resp.status_code, resp.content, str(e))
+    return f"Request failed: {e}"
+
+
+def iter_sse(resp: requests.Response) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Parse a text/event-stream response into (event, data) pairs; event defaults to "message"."""
+    event, data_lines = "message", []
+    for line in resp.iter_lines(decode_unicode=True):
+        if not line:
+            if data_lines:
+                yield event, orjson.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].lstrip())
+
+
+_COPY_JS = Template(
+    """
         <button id="copybtn" style="padding:0.4rem 0.7rem; border-radius:8px;">Copy to clipboard</button>
         <span id="copied" style="margin-left:8px; color:gray;"></span>
         <script>
-          const txt = {safe};
+          const txt = $payload;
           const btn = document.getElementById('copybtn');
           const info = document.getElementById('copied');
-          btn.addEventListener('click', async () => {{
-            try {{
+          btn.addEventListener('click', async () => {
+            try {
               await navigator.clipboard.writeText(txt);
               info.textContent = "Copied!";
               setTimeout(() => info.textContent = "", 1200);
-            }} catch(e) {{
+            } catch(e) {
               info.textContent = "Copy failed";
-            }}
-          }});
+            }
+          });
         </script>
-        """,
-        height=38,
-    )
+        """
+)
 
 
-def load_examples(dir_path: Path, max_bytes: int = 20_000) -> Dict[str, str]:
+def stream_route_missing(resp: requests.Response) -> bool:
+    """True if the backend has no /translate/stream route (older versions); other errors are real errors."""
+    if resp.status_code in (405, 406):
+        return True
+    if resp.status_code != 404:
+        return False
+    # An unknown route answers FastAPI's generic 404; an unknown model carries its own detail
+    try:
+        return orjson.loads(resp.content).get("detail") == "Not Found"
+    except Exception:
+        return True
+
+
+def copy_to_clipboard_js(text: str):
+    # Only the JSON payload is formatted, and only when the text changed; the markup is built once at import.
+    # "</" is escaped so the text can't close the <script> tag.
+    # The component is still emitted on every rerun (an element that isn't re-emitted is removed),
+    # but identical markup lets the browser keep the existing iframe instead of rebuilding it.
+    h = hash(text)
+    cached = st.session_state.get("_copy_html")
+    if cached is None or cached[0] != h:
+        cached = (h, _COPY_JS.substitute(payload=json.dumps(text).replace("</", "<\\/")))
+        st.session_state._copy_html = cached
+    html(cached[1], height=38)
+
+
+def session_derived(slot: str, raw: str, fn: Callable[[str], Any]) -> Any:
+    """
+    fn(raw), kept in st.session_state[slot] and recomputed only when the raw widget value changes.
+    Used for sidebar inputs, which are re-read on every rerun but rarely edited.
+    """
+    raw_slot = f"_raw_{slot}"
+    if st.session_state.get(raw_slot) != raw or slot not in st.session_state:
+        st.session_state[slot] = fn(raw)
+        st.session_state[raw_slot] = raw
+    return st.session_state[slot]
+
+
+def examples_signature(dir_path: Path) -> Tuple[Tuple[str, int, int], ...]:
+    """(name, mtime_ns, size) of every *.txt in dir_path; changes whenever a file does."""
+    sig = []
+    for p in dir_path.glob("*.txt"):
+        try:
+            info = p.stat()
+        except OSError:
+            continue
+        sig.append((p.name, info.st_mtime_ns, info.st_size))
+    return tuple(sorted(sig))
+
+
+@st.cache_data(show_spinner=False)
+def load_examples(dir_path_str: str, dir_sig: Tuple[Tuple[str, int, int], ...], max_bytes: int = 20_000) -> Dict[str, str]:
     """
-    Load *.txt files from dir_path (non-recursive).
+    Load *.txt files from dir_path_str (non-recursive).
     Returns {filename: text}. Truncates very large files to max_bytes.
+    Cached per (directory, dir_sig): files are only re-read when the signature changes.
     """
     examples: Dict[str, str] = {}
+    dir_path = Path(dir_path_str)
     if not dir_path.exists():
         return examples
     for p in sorted(dir_path.glob("*.txt")):
         try:
-            data = p.read_bytes()
-            if len(data) > max_bytes:
-                data = data[:max_bytes]
+            # Only pull the prefix we keep off disk
+            with p.open("rb") as f:
+                data = f.read(max_bytes)
             text = data.decode("utf-8", errors="replace").strip()
             examples[p.name] = text
         except Exception as e:
@@ -70,6 +245,52 @@ def load_examples(dir_path: Path, max_bytes: int = 20_000) -> Dict[str, str]:
 
 
 # ----------------- App -----------------
+@st.fragment
+def translate_all_panel(api_base: str, model_name: str, examples: Dict[str, str]) -> None:
+    """
+    "Translate all examples" button and its results. As a fragment, clicking the button reruns only
+    this function, not the model/examples loading and input widgets of the whole script.
+    """
+    if not st.button("Translate all examples"):
+        return
+    ex_names = list(examples.keys())
+    # Independent requests: send them concurrently over the pooled session (the backend batches them)
+    started = time.perf_counter()
+    progress = st.progress(0.0, text="Translating examples…")
+    results: Dict[str, str] = {}
+    failures: Dict[str, str] = {}
+    with ThreadPoolExecutor(max_workers=min(8, len(ex_names))) as pool:
+        futures = {
+            pool.submit(translate_text, api_base, model_name, examples[name]): name for name in ex_names
+        }
+        for done, fut in enumerate(as_completed(futures), start=1):
+            name = futures[fut]
+            try:
+                results[name] = fut.result()
+            except Exception as e:
+                failures[name] = error_message(e)
+            progress.progress(done / len(futures), text=f"Translated {done}/{len(futures)}")
+    elapsed_ms = (time.perf_counter() - started) * 1000.0
+    progress.empty()
+
+    st.markdown(f"**All examples** ({len(results)}/{len(ex_names)} in {elapsed_ms:.0f} ms)")
+    for name in ex_names:
+        with st.expander(name):
+            if name in failures:
+                st.error(failures[name])
+            else:
+                st.text(results[name])
+
+
+def _store_stripped_input() -> None:
+    # Strip once per edit, not on every rerun
+    st.session_state.in_text_stripped = (st.session_state.in_text or "").strip()
+
+
+def _start_translation() -> None:
+    st.session_state._inflight = True
+
+
 def main():
     st.set_page_config(page_title="Translator UI (es→en)", page_icon="🌐", layout="wide")
     st.title("Translator UI (es → en)")
@@ -81,24 +302,38 @@ def main():
 
     # Sidebar: backend + examples
     st.sidebar.header("Backend")
-    api_base = st.sidebar.text_input("API base URL", value="http://localhost:8080").rstrip("/")
+    api_base_raw = st.sidebar.text_input("API base URL", value="http://localhost:8080")
+    api_base = session_derived("api_base", api_base_raw, lambda raw: raw.rstrip("/"))
+    stream_output = st.sidebar.toggle(
+        "Stream output",
+        value=False,
+        help="Show the translation as it is decoded. Uses greedy decoding, so the text can differ from the "
+        "default (beam search) result.",
+    )
+    refresh_models = st.sidebar.button("Refresh models")
+    if refresh_models:
+        fetch_models.clear()
 
     st.sidebar.header("Examples")
     ex_dir_str = st.sidebar.text_input("Examples directory", value="examples")
-    ex_dir = Path(ex_dir_str).expanduser().resolve()
+    # resolve() stats every path component; only redo it when the input changes
+    ex_dir = session_derived("ex_dir", ex_dir_str, lambda raw: Path(raw).expanduser().resolve())
     reload_examples = st.sidebar.button("Reload examples")
+    if reload_examples:
+        load_examples.clear()
 
-    # Fetch model list from backend
-    try:
-        r = requests.get(f"{api_base}/models", timeout=5)
-        r.raise_for_status()
-        models_payload = r.json()
-    except Exception as e:
-        st.error(f"Failed to fetch {api_base}/models: {e}")
-        st.stop()
+    # Model list and examples live in session_state and are only refetched on a refresh button or
+    # when the API base / examples directory changes, so plain reruns (typing) do no I/O
+    if refresh_models or st.session_state.get("models_for") != api_base:
+        try:
+            st.session_state.models_payload, st.session_state.es_en_names = fetch_models(api_base)
+        except Exception as e:
+            st.error(f"Failed to fetch {api_base}/models: {e}")
+            st.stop()
+        st.session_state.models_for = api_base
+    models_payload = st.session_state.models_payload
+    es_en_names = st.session_state.es_en_names
 
-    model_items = models_payload.get("models", [])
-    es_en_names = filter_es_to_en(model_items)
     if not es_en_names:
         st.warning("No es→en models found in /models.")
         st.json(models_payload)
@@ -107,7 +342,10 @@ def main():
     model_name = st.selectbox("Model", options=es_en_names, index=0)
 
     # Load example files
-    examples = load_examples(ex_dir)
+    if reload_examples or st.session_state.get("examples_for") != str(ex_dir):
+        st.session_state.examples = load_examples(str(ex_dir), examples_signature(ex_dir))
+        st.session_state.examples_for = str(ex_dir)
+    examples = st.session_state.examples
     ex_names = list(examples.keys())
 
     # Examples selector (only if there are files)
@@ -124,6 +362,8 @@ def main():
         # Auto-fill input when a file is selected
         if selected_example != "— (none) —":
             st.session_state.in_text = examples[selected_example]
+            st.session_state.in_text_stripped = examples[selected_example]  # already stripped on load
+        translate_all_panel(api_base, model_name, examples)
     else:
         st.info(f"No .txt files found in {ex_dir}")
 
@@ -133,11 +373,20 @@ def main():
         height=160,
         placeholder="Escribe aquí el texto en español…",
         key="in_text",  # bound to session_state
+        on_change=_store_stripped_input,
     )
 
     col1, col2, col3 = st.columns([1, 1, 2])
     with col1:
-        run_btn = st.button("Translate", type="primary", use_container_width=True)
+        # The click callback flags the run before the script reruns, so the button is already disabled
+        # while that translation is in flight (a disabled button can't be double-submitted)
+        st.button(
+            "Translate",
+            type="primary",
+            use_container_width=True,
+            disabled=st.session_state.get("_inflight", False),
+            on_click=_start_translation,
+        )
     with col2:
         clear_btn = st.button("Clear input", use_container_width=True)
     with col3:
@@ -149,6 +398,8 @@ def main():
         st.session_state.pop("in_text", None)
         # Optional: also reset the example picker
         st.session_state.pop("example_select", None)
+        st.session_state.pop("in_text_stripped", None)
+        st.session_state.pop("last_result", None)
         st.rerun()
 
 
@@ -156,34 +407,78 @@ def main():
     out_text_area = st.empty()
     copy_zone = st.empty()
 
-    if run_btn:
-        text_to_send = (st.session_state.in_text or "").strip()
-        if not text_to_send:
-            st.warning("Please enter some Spanish text (or pick an example).")
-        else:
-            body = {"model": model_name, "text": text_to_send}
-            started = time.perf_counter()
-            try:
-                resp = requests.post(f"{api_base}/translate", json=body, timeout=60)
-                elapsed_ms = (time.perf_counter() - started) * 1000.0
-                t_label.caption(f"⏱️ {elapsed_ms:.0f} ms")
+    if st.session_state.get("_inflight"):
+        text_to_send = st.session_state.get("in_text_stripped", "")
+        try:
+            if not text_to_send:
+                st.session_state.last_result = {"warning": "Please enter some Spanish text (or pick an example)."}
+            else:
+                body = orjson.dumps({"model": model_name, "text": text_to_send})  # encoded once, sent as-is
+                started = time.perf_counter()
+                try:
+                    output: Optional[str] = None
+                    # Opt-in: streaming decodes greedily, so it can differ from the default (beam search) output.
+                    # Backends without /translate/stream fall back to /translate below.
+                    if stream_output:
+                        with _http().post(
+                            f"{api_base}/translate/stream", data=body, headers=_JSON_HEADERS, stream=True, timeout=60
+                        ) as resp:
+                            if not stream_route_missing(resp):
+                                if not resp.ok:
+                                    _ = resp.content  # buffer the error body so `detail` can be read after close
+                                resp.raise_for_status()
+                                buf, last_draw = "", 0.0
+                                for event, data in iter_sse(resp):
+                                    if event == "error":
+                                        raise RuntimeError(data.get("detail"))
+                                    if event == "done":
+                                        output = data.get("output", buf)
+                                        break
+                                    buf += data.get("text", "")
+                                    # Throttle redraws: each one rebuilds the element
+                                    now = time.monotonic()
+                                    if now - last_draw >= 0.1:
+                                        if not last_draw:
+                                            first_ms = (time.perf_counter() - started) * 1000.0
+                                            t_label.caption(f"⏱️ first text after {first_ms:.0f} ms")
+                                        out_text_area.text(buf)
+                                        last_draw = now
+                                if output is None:
+                                    raise RuntimeError("stream ended without a result")
 
-                resp.raise_for_status()
-                payload = resp.json()
-                output = payload.get("output", "")
+                    if output is not None:
+                        # resp.elapsed stops at the response headers, so a stream is timed on the client
+                        elapsed_ms = (time.perf_counter() - started) * 1000.0
+                        timing = f"⏱️ total {elapsed_ms:.0f} ms (streamed)"
+                    else:
+                        resp = _http().post(f"{api_base}/translate", data=body, headers=_JSON_HEADERS, timeout=60)
+                        resp.raise_for_status()
+                        output = orjson.loads(resp.content).get("output", "")
+                        # Network + server time vs. server time alone (X-Backend-Time, set by the backend)
+                        timing = (
+                            f"⏱️ total {resp.elapsed.total_seconds() * 1000.0:.0f} ms · "
+                            f"backend {resp.headers.get('X-Backend-Time', '?')} ms"
+                        )
+                    st.session_state.last_result = {"output": output, "timing": timing}
 
-                out_status.success("Done")
-                out_text_area.text_area("English (read-only)", value=output, height=160, disabled=True)
-                copy_to_clipboard_js(output)
+                except Exception as e:
+                    st.session_state.last_result = {"error": error_message(e)}
+        finally:
+            st.session_state._inflight = False
+        # Rerun so the Translate button is rendered enabled again; the result is shown from session_state
+        st.rerun()
 
-            except requests.HTTPError as e:
-                try:
-                    detail = resp.json().get("detail")
-                except Exception:
-                    detail = str(e)
-                st.error(f"HTTP {resp.status_code}: {detail}")
-            except Exception as e:
-                st.error(f"Request failed: {e}")
+    result = st.session_state.get("last_result")
+    if result:
+        if "warning" in result:
+            out_status.warning(result["warning"])
+        elif "error" in result:
+            out_status.error(result["error"])
+        else:
+            t_label.caption(result["timing"])
+            out_status.success("Done")
+            out_text_area.text_area("English (read-only)", value=result["output"], height=160, disabled=True)
+            copy_to_clipboard_js(result["output"])
 
 
 if __name__ == "__main__":